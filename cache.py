@@ -0,0 +1,263 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    # faiss 为可选依赖，未安装时用 numpy 检索，缓存条目不多时差别不大
+    faiss = None
+
+
+class ResponseCache:
+    """按精确键缓存生成结果，带过期时间和 LRU 容量上限，可在多个会话线程间共享"""
+
+    def __init__(self, ttl=3600, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, content = entry
+            if time.monotonic() - created >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return content
+
+    def set(self, key, content):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), content)
+            self._entries.move_to_end(key)
+            # 超出容量时淘汰最久未使用的条目
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# 同一条目的输入被向量接口拒绝达到该次数后直接删除，避免每次请求都重试注定失败的条目
+_MAX_REFRESH_ATTEMPTS = 3
+
+
+class SemanticCache:
+    """按向量相似度缓存生成结果：设置相近的请求直接复用已有方案，条目持久化在 SQLite 中供后续会话使用"""
+
+    def __init__(self, path, model, threshold=0.92, max_entries=512):
+        self.path = path
+        # 求向量所用的模型：换用其他模型后，旧条目的向量需要重新计算才能参与比较
+        self.model = model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # 每个分组一个向量索引，检索只在同一分组内进行
+        self._indexes = {}
+        # 缺少向量或向量模型已更换的条目：(行号, 分组, 原文, 内容)，等待 refresh 批量重新求向量
+        self._stale = []
+        # 待更新条目已失败的次数：{行号: 次数}
+        self._refresh_failures = {}
+        self._lock = threading.Lock()
+        # 连接在多个会话线程间共享，所有访问都在锁内进行
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._load()
+        except sqlite3.OperationalError:
+            # 数据库被其他进程锁定或读写出错时文件本身完好，不能删除，交给调用方按缓存不可用处理
+            self._conn.close()
+            raise
+        except sqlite3.DatabaseError:
+            # 缓存文件损坏或不是 SQLite 数据库时丢弃它，从空缓存开始
+            self._conn.close()
+            os.remove(path)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._indexes, self._stale = {}, []
+            self._load()
+
+    def lookup(self, group, embedding):
+        """在同一分组内查找最相似的条目，余弦相似度达到阈值时返回其内容"""
+        vector = _normalize(embedding)
+        with self._lock:
+            index = self._indexes.get(group)
+            hit = index.search(vector) if index is not None else None
+        if hit is None or hit[0] < self.threshold:
+            return None
+        return hit[1]
+
+    def refresh(self, embed, group_prefix="", batch_size=25, permanent_errors=()):
+        """为分组以 group_prefix 开头的待更新条目重新求向量并加入索引
+
+        embed 接收文本列表，按相同顺序返回向量，每批最多 batch_size 条。embed 抛出 permanent_errors 中的
+        异常表示输入本身无法求向量：整批被拒时逐条重试找出问题条目，单条累计被拒 _MAX_REFRESH_ATTEMPTS
+        次后删除。其他异常视为限流、网络等临时故障，剩余条目原样留待下次重试，不计失败次数。
+        有失败时最后抛出该错误
+        """
+        # 先取走待更新条目再在锁外调用向量接口，避免网络请求期间阻塞其他会话的检索
+        with self._lock:
+            stale = [row for row in self._stale if row[1].startswith(group_prefix)]
+            if not stale:
+                return
+            self._stale = [row for row in self._stale if not row[1].startswith(group_prefix)]
+
+        batches = [stale[start:start + batch_size] for start in range(0, len(stale), batch_size)]
+        error = None
+        while batches:
+            batch = batches.pop()
+            try:
+                vectors = _normalize(embed([query for _, _, query, _ in batch]))
+            except permanent_errors as e:
+                error = e
+                if len(batch) > 1:
+                    batches.extend([row] for row in batch)
+                else:
+                    self._requeue(batch, count_failure=True)
+                continue
+            except Exception as e:
+                # 临时故障时后续批次大概率同样失败，全部留待下次
+                error = e
+                self._requeue([row for rows in batches for row in rows] + batch, count_failure=False)
+                break
+
+            with self._lock:
+                for (row_id, group, _, content), vector in zip(batch, vectors):
+                    self._refresh_failures.pop(row_id, None)
+                    cursor = self._conn.execute(
+                        "UPDATE entries SET embedding = ?, model = ? WHERE id = ?",
+                        (vector.tobytes(), self.model, row_id),
+                    )
+                    # 等待期间已被淘汰的条目不再加入索引
+                    if cursor.rowcount:
+                        self._index_for(group, vector.size).add([row_id], vector[None, :], [content])
+                self._conn.commit()
+        if error is not None:
+            raise error
+
+    def _requeue(self, rows, count_failure):
+        with self._lock:
+            if not count_failure:
+                self._stale.extend(rows)
+                return
+            expired = []
+            for row in rows:
+                row_id = row[0]
+                failures = self._refresh_failures.get(row_id, 0) + 1
+                if failures >= _MAX_REFRESH_ATTEMPTS:
+                    self._refresh_failures.pop(row_id, None)
+                    expired.append((row_id,))
+                else:
+                    self._refresh_failures[row_id] = failures
+                    self._stale.append(row)
+            if expired:
+                self._conn.executemany("DELETE FROM entries WHERE id = ?", expired)
+                self._conn.commit()
+
+    def add(self, group, query, embedding, content):
+        """写入一条缓存；query 为求向量的原文，保存下来便于日后重新求向量"""
+        vector = _normalize(embedding)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO entries (grp, query, embedding, model, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (group, query, vector.tobytes(), self.model, content, time.time()),
+            )
+            self._index_for(group, vector.size).add([cursor.lastrowid], vector[None, :], [content])
+            self._evict()
+            self._conn.commit()
+
+    def _index_for(self, group, dim):
+        index = self._indexes.get(group)
+        if index is None:
+            index = self._indexes[group] = _VectorIndex(dim)
+        return index
+
+    def _evict(self):
+        # 超出容量时按写入顺序淘汰最早的条目
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        rows = self._conn.execute("SELECT id, grp FROM entries ORDER BY id LIMIT ?", (overflow,)).fetchall()
+        self._conn.executemany("DELETE FROM entries WHERE id = ?", [(row_id,) for row_id, _ in rows])
+        evicted = {}
+        for row_id, group in rows:
+            evicted.setdefault(group, []).append(row_id)
+        for group, row_ids in evicted.items():
+            index = self._indexes.get(group)
+            if index is not None:
+                index.remove(row_ids)
+
+    def _load(self):
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, grp TEXT NOT NULL, query TEXT NOT NULL, "
+            "embedding BLOB, model TEXT, content TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        rows_by_group = {}
+        for row_id, group, query, blob, model, content in self._conn.execute(
+                "SELECT id, grp, query, embedding, model, content FROM entries ORDER BY id"):
+            if blob is None or model != self.model:
+                self._stale.append((row_id, group, query, content))
+                continue
+            rows_by_group.setdefault(group, []).append((row_id, np.frombuffer(blob, dtype=np.float32), content))
+        for group, rows in rows_by_group.items():
+            row_ids, vectors, contents = zip(*rows)
+            self._index_for(group, vectors[0].size).add(row_ids, np.vstack(vectors), contents)
+
+
+class _VectorIndex:
+    """单个分组的内积索引：装有 faiss 时用 IndexFlatIP 检索，否则退化为 numpy 矩阵乘法"""
+
+    def __init__(self, dim):
+        self._contents = {}
+        if faiss is not None:
+            # IndexIDMap 让检索结果直接带回 SQLite 中的行号，并支持按行号删除
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        else:
+            self._ids = np.empty(0, dtype=np.int64)
+            self._matrix = np.empty((0, dim), dtype=np.float32)
+
+    def add(self, row_ids, vectors, contents):
+        ids = np.asarray(row_ids, dtype=np.int64)
+        if faiss is not None:
+            self._index.add_with_ids(vectors, ids)
+        else:
+            self._ids = np.concatenate([self._ids, ids])
+            self._matrix = np.vstack([self._matrix, vectors])
+        self._contents.update(zip(row_ids, contents))
+
+    def remove(self, row_ids):
+        ids = np.asarray(row_ids, dtype=np.int64)
+        if faiss is not None:
+            self._index.remove_ids(ids)
+        else:
+            keep = ~np.isin(self._ids, ids)
+            self._ids = self._ids[keep]
+            self._matrix = self._matrix[keep]
+        for row_id in row_ids:
+            self._contents.pop(row_id, None)
+
+    def search(self, vector):
+        """返回最相似条目的 (相似度, 内容)，索引为空时返回 None"""
+        if not self._contents:
+            return None
+        if faiss is not None:
+            scores, ids = self._index.search(vector[None, :], 1)
+            score, row_id = scores[0, 0], ids[0, 0]
+        else:
+            # 向量均已归一化，矩阵乘法一次得到所有候选的余弦相似度
+            scores = self._matrix @ vector
+            best = int(np.argmax(scores))
+            score, row_id = scores[best], self._ids[best]
+        return float(score), self._contents[int(row_id)]
+
+
+def _normalize(embedding):
+    """L2 归一化单个向量，或按行归一化一组向量"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector, axis=-1, keepdims=True)
@@ -0,0 +1,423 @@
+import functools
+import re
+import textwrap
+
+
+# 模块相关的特殊要求：{模块名: 说明}，只列出已选择模块的说明
+# 初始界面与暂停流程已在“具体控制要求”中给出，这里不再重复
+_MODULE_NOTES = {
+    "电机": "电机模块使用简单转子马达，只需两个信号线控制电压方向，无需使能控制。电机通过pwm调速。",
+    "显示屏": "显示屏主界面：第1行显示'Mode:[模式名]'，第2行显示运行参数",
+    "定时器": "定时器配置：TIM3实现1.5秒定时，用于刷新界面和状态检测；TIM2实现计数功能，记录关键参数",
+    "外部中断": "KEY1按键使用外部中断触发暂停功能",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def _special_notes(selected):
+    """按已选模块集合缓存特殊要求说明"""
+    notes = [note for module, note in _MODULE_NOTES.items() if module in selected]
+    return "\n".join(notes) or "无"
+
+
+def _get_general_info(modules, theme, function):
+    return {
+        "modules_desc": "、".join(modules),
+        "special_notes": _special_notes(frozenset(modules)),
+    }
+
+
+def _compact(modes):
+    """导入时去掉说明文字的源码缩进和首尾空行，每次请求少发送这些空白对应的输入 token"""
+    return tuple(textwrap.dedent(text).strip() for text in modes)
+
+
+# 流水线/传送带类主题的工作模式与工作控制说明
+_ASSEMBLY_LINE_MODES = _compact(("""
+            1. **手动控制模式**
+               - 用户直接控制设备运行
+               - 短按KEY1：循环调节电机速度（30%/50%/70%/90%四档）
+               - 短按KEY_UP：切换设备运行方向
+               - 指示灯：蓝色闪烁
+
+            2. **自动调节模式**
+               - 智能优化生产效率
+               - 系统每5秒自动计算最优工作参数
+               - KEY_UP作为传感器使用
+               - 指示灯：绿色常亮
+            """, """
+            3. **工作控制**
+               - 手动模式：用户根据需求调整工作参数
+               - 自动模式：系统基于传感器数据自动优化工作效率
+            """))
+
+
+# 旋转设备类主题的工作模式与工作控制说明
+_ROTARY_MODES = _compact(("""
+            1. **低速模式**
+               - 轻柔工作状态
+               - 低转速（300-500 RPM）
+               - 适合精细处理
+               - 指示灯：绿色慢闪
+
+            2. **标准模式**
+               - 正常工作状态
+               - 标准转速（500-800 RPM）
+               - 平衡效率和能耗
+               - 指示灯：白色常亮
+
+            3. **高速模式**
+               - 高效工作状态
+               - 高转速（1000-1200 RPM）
+               - 最大生产效率
+               - 指示灯：红色闪烁
+            """, """
+            3. **工作控制**
+               - 不同模式对应预设工作参数
+               - 系统自动应用最合适的运行策略
+            """))
+
+
+# 票务类主题的工作模式与工作控制说明
+_TICKET_MODES = _compact(("""
+            1. **售票模式**
+               - 主工作状态
+               - 处理票务销售
+               - 支持多种票型和支付方式
+               - 指示灯：绿色常亮
+
+            2. **查询模式**
+               - 信息查询状态
+               - 查看历史销售记录
+               - 分析票务数据
+               - 指示灯：蓝色闪烁
+
+            3. **维护模式**
+               - 系统维护状态
+               - 管理员配置系统参数
+               - 系统升级和维护
+               - 指示灯：红色闪烁
+            """, """
+            3. **工作控制**
+               - 售票模式：完成票务处理流程
+               - 查询模式：提供信息查询服务
+               - 维护模式：系统维护和设置
+            """))
+
+
+# 电梯类主题的工作模式与工作控制说明
+_ELEVATOR_MODES = _compact(("""
+            1. **标准运行模式**
+               - 正常工作状态
+               - 响应楼层呼叫
+               - 优化运输效率
+               - 指示灯：白色常亮
+
+            2. **节能运行模式**
+               - 低功耗运行状态
+               - 减少空载运行
+               - 延长设备寿命
+               - 指示灯：绿色慢闪
+
+            3. **高峰运行模式**
+               - 高效运输状态
+               - 优先响应高流量楼层
+               - 最大化运输效率
+               - 指示灯：红色闪烁
+
+            4. **维护模式**
+               - 系统维护状态
+               - 工程师调试和检修
+               - 指示灯：黄色闪烁
+            """, """
+            3. **工作控制**
+               - 标准模式：平衡效率和能耗
+               - 节能模式：低功耗运行
+               - 高峰模式：最大化运输效率
+               - 维护模式：系统调试和检修
+            """))
+
+
+# 智能家居类主题的工作模式与工作控制说明
+_SMART_HOME_MODES = _compact(("""
+            1. **居家模式**
+               - 家庭成员在家状态
+               - 舒适环境设置
+               - 灯光和温度自动调节
+               - 指示灯：白色常亮
+
+            2. **离家模式**
+               - 家庭成员外出状态
+               - 节能安全设置
+               - 关闭非必要设备
+               - 指示灯：蓝色慢闪
+
+            3. **睡眠模式**
+               - 夜间休息状态
+               - 安静舒适环境
+               - 调暗灯光降低噪音
+               - 指示灯：紫色慢闪
+
+            4. **娱乐模式**
+               - 家庭娱乐状态
+               - 优化影音设备
+               - 调整灯光氛围
+               - 指示灯：彩色循环
+            """, """
+            3. **工作控制**
+               - 居家模式：舒适生活环境
+               - 离家模式：节能安全防护
+               - 睡眠模式：安静休息环境
+               - 娱乐模式：家庭娱乐优化
+            """))
+
+
+# 农业温室类主题的工作模式与工作控制说明
+_GREENHOUSE_MODES = _compact(("""
+            1. **自动灌溉模式**
+               - 智能浇水状态
+               - 根据土壤湿度调节
+               - 指示灯：蓝色常亮
+
+            2. **通风模式**
+               - 空气循环状态
+               - 调节温湿度
+               - 防止病虫害
+               - 指示灯：绿色慢闪
+
+            3. **补光模式**
+               - 光照增强状态
+               - 阴天或夜间补充光照
+               - 促进植物生长
+               - 指示灯：黄色闪烁
+
+            4. **监控模式**
+               - 环境监测状态
+               - 实时采集温湿度数据
+               - 生成生长报告
+               - 指示灯：白色闪烁
+            """, """
+            3. **工作控制**
+               - 灌溉模式：智能水分管理
+               - 通风模式：优化空气循环
+               - 补光模式：补充光照需求
+               - 监控模式：环境数据采集
+            """))
+
+
+# 停车场类主题的工作模式与工作控制说明
+_PARKING_MODES = _compact(("""
+            1. **入场模式**
+               - 车辆进入管理
+               - 车牌识别
+               - 车位分配
+               - 指示灯：绿色常亮
+
+            2. **出场模式**
+               - 车辆离开管理
+               - 费用计算
+               - 支付处理
+               - 指示灯：蓝色闪烁
+
+            3. **寻车模式**
+               - 帮助车主找车
+               - 车位导航
+               - 最短路径规划
+               - 指示灯：黄色闪烁
+
+            4. **维护模式**
+               - 系统维护状态
+               - 设备检修
+               - 数据备份
+               - 指示灯：红色闪烁
+            """, """
+            3. **工作控制**
+               - 入场模式：车辆进入管理
+               - 出场模式：车辆离开处理
+               - 寻车模式：车位导航服务
+               - 维护模式：系统检修维护
+            """))
+
+
+# 照明类主题的工作模式与工作控制说明
+_LIGHTING_MODES = _compact(("""
+            1. **标准照明模式**
+               - 正常工作状态
+               - 固定亮度设置
+               - 指示灯：白色常亮
+
+            2. **节能模式**
+               - 低功耗运行状态
+               - 根据环境光调节亮度
+               - 减少能耗
+               - 指示灯：绿色慢闪
+
+            3. **场景模式**
+               - 特殊场景设置
+               - 如聚会、阅读、观影等
+               - 自定义灯光效果
+               - 指示灯：彩色循环
+
+            4. **安全模式**
+               - 应急照明状态
+               - 断电时自动启用
+               - 提供基本照明
+               - 指示灯：红色闪烁
+            """, """
+            3. **工作控制**
+               - 标准模式：常规照明需求
+               - 节能模式：智能亮度调节
+               - 场景模式：特殊场景灯光
+               - 安全模式：应急照明保障
+            """))
+
+
+# 未匹配到任何主题关键词时使用的通用模式方案
+_DEFAULT_MODES = _compact(("""
+            1. **手动模式**
+               - 标准工作状态
+               - 通过按键调整工作参数及模式
+               - 适合常规工作场景
+               - 指示灯：白色常亮
+
+            2. **自动模式**
+               - 通过定时器自动调整工作参数及模式
+               - 指示灯：绿色慢闪
+
+            """, """
+            3. **工作控制**
+               - 使用KEY_UP在预设模式间切换
+               - KEY1用于微调工作参数
+               - 系统根据场景自动优化配置
+            """))
+
+
+# 主题关键词表：按顺序匹配，每组关键词预编译为一个正则，取第一个命中的模式方案
+_MODE_TABLE = [
+    (re.compile("流水线|传送带|生产线|装配线"), _ASSEMBLY_LINE_MODES),
+    (re.compile("洗衣机|搅拌机|旋转设备|脱水机"), _ROTARY_MODES),
+    (re.compile("票|售票|购票|验票|选座位"), _TICKET_MODES),
+    (re.compile("电梯|升降机|垂直运输"), _ELEVATOR_MODES),
+    (re.compile("家居|智能家居|家庭自动化"), _SMART_HOME_MODES),
+    (re.compile("农业|温室|大棚|种植"), _GREENHOUSE_MODES),
+    (re.compile("停车场|车库|车位管理"), _PARKING_MODES),
+    (re.compile("照明|灯光|路灯"), _LIGHTING_MODES),
+]
+
+
+def _match_modes(theme):
+    for pattern, modes in _MODE_TABLE:
+        if pattern.search(theme):
+            return pattern.pattern, modes
+    return "", _DEFAULT_MODES
+
+
+def _get_mode_description(theme):
+    return _match_modes(theme)[1]
+
+
+def mode_family(theme):
+    """主题命中的模式方案标识（该组关键词的正则），未命中任何关键词时为空字符串"""
+    return _match_modes(theme)[0]
+
+
+# 角色、按键功能表与设计约束，完整方案和模块分项说明共用
+_SYSTEM_RULES = textwrap.dedent("""
+    你是一名经验丰富的嵌入式系统工程师，擅长设计多模块硬件教学系统，负责按嵌入式课堂项目设计标准格式编写项目任务书。
+
+    **按键功能表（所有项目通用）：**
+    | 按键名称 | 功能描述 |
+    |---|---|
+    | KEY0 | 确定/启动按键；短按：启动/恢复控制；长按(2秒)：进入模式切换 |
+    | KEY1 | 多功能按键；短按：参数调节/功能选择；长按(>2秒)：暂停/恢复 |
+    | KEY_UP | 传感器/选择器；正常工作时：信号输入；模式切换时：选项选择 |
+
+    **设计约束：**
+    1. 只使用预定义的三个按键（KEY0/KEY1/KEY_UP）和两个LED（LED0/LED1）
+    2. 硬件引脚分配不包含显示屏相关引脚（如果使用显示屏）
+    3. 不包含电源、工作电压等基本因素
+    4. 按键功能明确无冲突
+""").strip()
+
+# 系统提示词：与主题、模块无关的通用规则，逐字节固定不变，
+# 使每次请求的消息前缀一致，可以命中 DashScope 服务端的前缀缓存
+SYSTEM_PROMPT = _SYSTEM_RULES + "\n\n" + textwrap.dedent("""
+    **输出结构：**
+    请根据用户给出的项目信息编写项目任务书，严格按照以下结构生成内容（使用中文，不使用Markdown），方括号内为填写说明：
+
+    ##### 一、任务题目
+    一种智能[项目主题]控制系统
+
+    ##### 二、控制功能
+    [用150-200字描述项目整体功能，突出核心控制逻辑和用户交互]
+
+    ##### 三、按键功能
+    [按上面的按键功能表输出]
+
+    ##### 四、工作模式
+    [按项目信息中的“工作模式”输出]
+
+    ##### 五、具体控制要求
+    1. **初始界面显示**
+       - 上电后在显示屏第1行显示系统名称（项目主题），第2行显示欢迎标语
+       - 短按KEY0后进入主控界面
+
+    2. **模式切换控制**
+       - 使用KEY_UP切换不同模式，显示屏显示新的工作模式和运行参数
+
+    [按项目信息中的“工作控制”输出第3条]
+
+    4. **暂停控制**
+       - 系统运行中按下KEY1立即暂停，界面冻结不再刷新
+       - 短按KEY0恢复暂停前状态继续运行
+
+    ##### 六、硬件引脚分配
+    | 引脚号 | 功能描述 | 类型 | 关联模块 | 用途说明 |
+    |---|---|---|---|---|
+""").strip()
+
+# 模块分项说明的系统提示词：每次只为一个模块编写说明，各模块可以独立并发生成
+MODULE_SYSTEM_PROMPT = _SYSTEM_RULES + "\n\n" + textwrap.dedent("""
+    **输出结构：**
+    请根据用户给出的项目信息，只编写其中“指定模块”的分项设计说明，严格按照以下结构生成内容（使用中文，不使用Markdown），方括号内为填写说明：
+
+    ##### [指定模块]模块设计
+    1. **模块作用**
+       [用50-100字说明该模块在项目中承担的功能]
+
+    2. **控制要求**
+       [分条列出该模块在各工作模式下的具体行为，以及与按键、LED的配合]
+
+    3. **引脚分配**
+    | 引脚号 | 功能描述 | 类型 | 用途说明 |
+    |---|---|---|---|
+""").strip()
+
+
+def create_prompt(modules, theme, function):
+    # 获取通用信息
+    info = _get_general_info(modules, theme, function)
+    mode_desc, work_control = _get_mode_description(theme)
+
+    # 用户消息只包含本次请求的项目信息，其余说明都在固定的 SYSTEM_PROMPT 中
+    return (
+        f"项目主题：{theme}\n"
+        f"主要功能：{function}\n"
+        f"项目模块：{info['modules_desc']}\n"
+        f"特殊要求：\n{info['special_notes']}\n"
+        f"工作模式：\n{mode_desc}\n"
+        f"工作控制：\n{work_control}"
+    )
+
+
+def create_module_prompt(module, theme, function):
+    # 单个模块的项目信息，只附带该模块自身的特殊要求
+    mode_desc, _ = _get_mode_description(theme)
+
+    return (
+        f"项目主题：{theme}\n"
+        f"主要功能：{function}\n"
+        f"指定模块：{module}\n"
+        f"特殊要求：\n{_MODULE_NOTES.get(module, '无')}\n"
+        f"工作模式：\n{mode_desc}"
+    )
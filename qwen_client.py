@@ -0,0 +1,339 @@
+import contextlib
+import functools
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+import orjson
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.language_models import BaseChatModel
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+
+# DashScope 接口地址：生成与向量接口同源，共用同一个连接池
+_DASHSCOPE_ORIGIN = "https://dashscope.aliyuncs.com"
+_GENERATION_URL = f"{_DASHSCOPE_ORIGIN}/api/v1/services/aigc/text-generation/generation"
+_EMBEDDING_URL = f"{_DASHSCOPE_ORIGIN}/api/v1/services/embeddings/text-embedding/text-embedding"
+
+# 通用文本向量模型，以及单次请求最多可提交的文本条数
+EMBEDDING_MODEL = "text-embedding-v2"
+_EMBEDDING_BATCH_SIZE = 25
+
+# 可重试的状态码：限流和服务端临时故障；400/401 等客户端错误重试也不会成功
+_TRANSIENT_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# 对冲请求：流式请求超过该时长仍未收到响应头时，再发一个相同的请求，取先响应的一个
+_HEDGE_DELAY = 4.0
+
+# LangChain 消息类型到 DashScope 角色的映射
+_ROLE_MAP = {SystemMessage: "system", HumanMessage: "user", AIMessage: "assistant"}
+
+
+class TransientError(Exception):
+    """限流、服务端临时故障或建立连接失败，稍后重试可能成功"""
+
+
+class EmbeddingRejected(Exception):
+    """向量接口以 400 拒绝了输入（如文本超长），同样的输入重试也不会成功"""
+
+
+# 指数退避重试：最多 4 次尝试，等待约 0.5s、1s、2s…，单次等待不超过 8s；
+# 叠加随机抖动，避免多个会话在限流后同一时刻一起重试
+_retry_transient = retry(
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    stop=stop_after_attempt(4),
+    retry=retry_if_exception_type(TransientError),
+    reraise=True,
+)
+
+
+# 从响应 output 中取生成文本的两种路径：result_format=message 时在 choices 中，旧版 text 格式直接在 text 中
+_CONTENT_EXTRACTORS = (
+    lambda output: output["choices"][0]["message"]["content"],
+    lambda output: output["text"],
+)
+# 上一次取值成功的路径：所有调用都请求 result_format=message，响应结构在进程内不会变化，之后直接用它取值
+_CONTENT_EXTRACTOR = None
+
+
+def _extract_output_text(output):
+    """从响应 output 中取出生成文本，优先使用上次成功的取值路径，都取不到时返回 None"""
+    global _CONTENT_EXTRACTOR
+    if _CONTENT_EXTRACTOR is not None:
+        try:
+            content = _CONTENT_EXTRACTOR(output)
+        except (KeyError, IndexError, TypeError):
+            content = None
+        if content is not None:
+            return content
+
+    for extractor in _CONTENT_EXTRACTORS:
+        try:
+            content = extractor(output)
+        except (KeyError, IndexError, TypeError):
+            continue
+        if content is not None:
+            _CONTENT_EXTRACTOR = extractor
+            return content
+    return None
+
+
+def _match_role(msg):
+    """按消息类型（含子类）匹配 DashScope 角色，无法识别的消息按用户消息发送"""
+    match msg:
+        case SystemMessage():
+            return "system"
+        case HumanMessage():
+            return "user"
+        case AIMessage():
+            return "assistant"
+        case _:
+            return "user"
+
+
+@functools.lru_cache(maxsize=None)
+def _get_aio_generation():
+    """首次异步调用时才导入 dashscope SDK，同步路径直接走 REST 接口用不到它"""
+    from dashscope.aigc.generation import AioGeneration
+    return AioGeneration
+
+
+def embed_text(text, api_key):
+    """调用 DashScope 通用文本向量模型，返回文本的向量表示"""
+    return embed_texts([text], api_key)[0]
+
+
+def embed_texts(texts, api_key):
+    """批量求文本向量，每次请求最多提交 25 条，按输入顺序返回向量列表"""
+    embeddings = []
+    for start in range(0, len(texts), _EMBEDDING_BATCH_SIZE):
+        response = _get_http_client().post(
+            _EMBEDDING_URL,
+            json={"model": EMBEDDING_MODEL, "input": {"texts": texts[start:start + _EMBEDDING_BATCH_SIZE]}},
+            headers={"Authorization": f"Bearer {api_key}"}
+        )
+        payload = orjson.loads(response.content)
+        if response.status_code != 200:
+            error_msg = f"Embedding API Error ({response.status_code}): {payload.get('message', 'Unknown error')}"
+            # 只有输入本身不合法才是确定性失败；限流、鉴权和服务端故障换个时间或密钥可能成功
+            if response.status_code == 400:
+                raise EmbeddingRejected(error_msg)
+            raise Exception(error_msg)
+        # 结果中的 text_index 对应该批输入的下标，按它排序以保持输入顺序
+        batch = sorted(payload["output"]["embeddings"], key=lambda item: item["text_index"])
+        embeddings.extend(item["embedding"] for item in batch)
+    return embeddings
+
+
+def _close_response(future):
+    """关闭对冲中落选请求的响应，释放其占用的连接"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def warm_up():
+    """在后台线程预先建立到 DashScope 的 TLS 连接，用户第一次生成时直接复用"""
+    # 在当前线程创建连接池，后台线程与后续请求拿到的是同一个客户端
+    client = _get_http_client()
+
+    def _connect():
+        try:
+            client.head(_DASHSCOPE_ORIGIN)
+        except httpx.HTTPError:
+            # 预热失败不影响正常请求，真正调用时会重新建连
+            pass
+
+    threading.Thread(target=_connect, daemon=True).start()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_http_client():
+    """进程内共享的 HTTP/2 连接池，跨请求、会话和 Streamlit 重跑复用已建立的 TLS 连接"""
+    return httpx.Client(
+        http2=True,
+        # 所有会话线程共用：最多 16 个并发连接，空闲连接保留 60 秒
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16, keepalive_expiry=60),
+        # 生成完整方案可能需要几十秒，读超时要留足
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+
+
+class QwenChat(BaseChatModel):
+    api_key: str
+    temperature: float = 0.3
+
+    def _llm_type(self) -> str:
+        return "qwen-plus"
+
+    def _convert_messages(self, messages):
+        # 将 LangChain 消息格式转换为 DashScope 格式：
+        # 精确类型查表最快；AIMessageChunk 等子类查不到时再用 match 按继承关系匹配
+        return [
+            {
+                "role": _ROLE_MAP.get(type(msg)) or _match_role(msg),
+                "content": msg.content if hasattr(msg, "content") else str(msg),
+            }
+            for msg in messages
+        ]
+
+    def _request_body(self, messages, **kwargs):
+        return {
+            "model": self._llm_type(),
+            "input": {"messages": self._convert_messages(messages)},
+            "parameters": {
+                "temperature": kwargs.get("temperature", self.temperature),
+                "result_format": "message",
+            },
+        }
+
+    def _extract_content(self, payload, status_code=200):
+        # 增加健壮性检查
+        if payload is None:
+            raise Exception("API 调用返回 None。请检查网络连接和API密钥。")
+
+        if status_code != 200:
+            error_msg = f"API Error ({status_code}): {payload.get('message', 'Unknown error')}"
+            raise Exception(error_msg)
+
+        output = payload.get('output')
+        if output is None:
+            raise Exception("API 响应缺少 'output' 字段。")
+
+        # 从API响应中提取生成的文本内容
+        return _extract_output_text(output)
+
+    def _build_result(self, payload, status_code=200):
+        content = self._extract_content(payload, status_code)
+        if content is None:
+            raise Exception("无法从 API 响应中提取生成的文本内容。")
+
+        # 构造 LangChain 兼容的 ChatResult 对象
+        message = AIMessage(content=content)
+        generation = ChatGeneration(message=message)
+        usage = payload.get('usage', {})
+        llm_output = {"token_usage": usage, "model_name": self._llm_type()}
+        return ChatResult(generations=[generation], llm_output=llm_output)
+
+    def _send(self, body, stream=False):
+        """发出一次请求，不做重试；限流、服务端临时故障和建连失败转为 TransientError"""
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if stream:
+            headers["X-DashScope-SSE"] = "enable"
+        client = _get_http_client()
+        request = client.build_request("POST", _GENERATION_URL, json=body, headers=headers)
+        try:
+            response = client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            # 只重试建连阶段的错误；读超时说明请求已在服务端处理了 120 秒，
+            # 再重试会让用户多等几个 120 秒才看到报错
+            raise TransientError(f"网络错误: {e}") from e
+
+        if response.status_code in _TRANSIENT_STATUS:
+            response.close()
+            raise TransientError(f"API Error ({response.status_code})")
+        return response
+
+    @_retry_transient
+    def _post(self, body, stream=False):
+        return self._send(body, stream)
+
+    # 重试包在对冲外层：一轮对冲中的请求都失败后才整体退避重试，
+    # 不会在第一个请求退避等待期间再发出第二个请求，加重限流
+    @_retry_transient
+    def _hedged_post(self, body, stream=False):
+        """发出请求，_HEDGE_DELAY 秒内未返回时再发一个相同请求，返回先成功的那个响应"""
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            pending = {pool.submit(self._send, body, stream)}
+            done, pending = wait(pending, timeout=_HEDGE_DELAY)
+            if not done:
+                pending.add(pool.submit(self._send, body, stream))
+
+            error = None
+            while True:
+                for future in done:
+                    if future.exception() is None:
+                        # 其余请求不再需要：已完成的立即关闭，未完成的在完成后关闭
+                        for other in done | pending:
+                            if other is not future:
+                                other.add_done_callback(_close_response)
+                        return future.result()
+                    error = future.exception()
+                # 所有请求都失败时抛出最后一个错误
+                if not pending:
+                    raise error
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        finally:
+            # 不等待落选请求结束，它在后台线程完成后由回调关闭
+            pool.shutdown(wait=False)
+
+    @_retry_transient
+    async def _apost(self, dashscope_messages, temperature):
+        import aiohttp
+
+        try:
+            response = await _get_aio_generation().call(
+                model="qwen-plus",
+                messages=dashscope_messages,
+                temperature=temperature,
+                # 与同步、流式路径使用同一种响应结构，_CONTENT_EXTRACTOR 记住的取值路径对所有调用都有效
+                result_format="message",
+                api_key=self.api_key
+            )
+        except aiohttp.ClientConnectorError as e:
+            # 与同步路径一致，只重试建连失败，超时直接报错
+            raise TransientError(f"网络错误: {e}") from e
+
+        if response is not None and response.status_code in _TRANSIENT_STATUS:
+            raise TransientError(f"API Error ({response.status_code}): {getattr(response, 'message', '')}")
+        return response
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        body = self._request_body(messages, **kwargs)
+
+        try:
+            # 通过共享连接池直接调用 REST 接口，省去每次请求的 TCP/TLS 握手
+            response = self._post(body)
+            return self._build_result(orjson.loads(response.content), response.status_code)
+
+        except Exception as e:
+            raise Exception(f"调用 Qwen 模型时发生错误: {e}")
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        body = self._request_body(messages, **kwargs)
+        # 流式请求：incremental_output 使每个分片只包含新增的文本
+        body["parameters"]["incremental_output"] = True
+
+        try:
+            # 重试与对冲只发生在收到响应头之前，已经输出的分片不会重复；
+            # client.send 返回的流式响应不是上下文管理器，用 closing 保证读完或出错后释放连接
+            with contextlib.closing(self._hedged_post(body, stream=True)) as response:
+                for line in response.iter_lines():
+                    # SSE 事件中只有 data 行携带 JSON 负载；orjson 逐行解析比标准库 json 快数倍
+                    if not line.startswith("data:"):
+                        continue
+                    delta = self._extract_content(orjson.loads(line[5:]), response.status_code)
+                    if not delta:
+                        continue
+                    chunk = ChatGenerationChunk(message=AIMessageChunk(content=delta))
+                    if run_manager:
+                        run_manager.on_llm_new_token(delta, chunk=chunk)
+                    yield chunk
+
+                if response.status_code != 200:
+                    raise Exception(f"API Error ({response.status_code})")
+
+        except Exception as e:
+            raise Exception(f"调用 Qwen 模型时发生错误: {e}")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        dashscope_messages = self._convert_messages(messages)
+
+        try:
+            # 异步请求不阻塞事件循环，多个请求可通过 asyncio.gather 并发
+            response = await self._apost(dashscope_messages, kwargs.get("temperature", self.temperature))
+            return self._build_result(response, getattr(response, 'status_code', None))
+
+        except Exception as e:
+            raise Exception(f"调用 Qwen 模型时发生错误: {e}")
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from cache import SemanticCache
+
+
+class _Rejected(Exception):
+    pass
+
+
+@pytest.fixture
+def stale_cache(tmp_path):
+    """先用旧向量模型写入条目，再以新模型打开，所有条目都等待重新求向量"""
+    path = str(tmp_path / "cache.sqlite3")
+    rng = np.random.default_rng(0)
+    vectors = {f"q{i}": rng.normal(size=8) for i in range(6)}
+    old = SemanticCache(path, "old-model")
+    for query, vector in vectors.items():
+        old.add("key|group", query, vector, f"content-{query}")
+    old._conn.close()
+    return path, vectors
+
+
+def test_transient_errors_never_delete_stale_rows(stale_cache):
+    path, vectors = stale_cache
+    cache = SemanticCache(path, "new-model")
+
+    def embed(texts):
+        raise ConnectionError("embedding service unavailable")
+
+    for _ in range(5):
+        with pytest.raises(ConnectionError):
+            cache.refresh(embed, "key|", batch_size=4, permanent_errors=(_Rejected,))
+
+    cache.refresh(lambda texts: [vectors[t] for t in texts], "key|", batch_size=4, permanent_errors=(_Rejected,))
+    assert all(cache.lookup("key|group", v) == f"content-{q}" for q, v in vectors.items())
+
+
+def test_rejected_row_is_deleted_without_losing_its_batch(stale_cache):
+    path, vectors = stale_cache
+    cache = SemanticCache(path, "new-model")
+
+    def embed(texts):
+        if "q1" in texts:
+            raise _Rejected("input too long")
+        return [vectors[t] for t in texts]
+
+    for _ in range(3):
+        with pytest.raises(_Rejected):
+            cache.refresh(embed, "key|", batch_size=4, permanent_errors=(_Rejected,))
+
+    assert cache.lookup("key|group", vectors["q0"]) == "content-q0"
+    assert cache.lookup("key|group", vectors["q1"]) is None
+    # 被拒三次的条目已从数据库删除，重新打开后不再等待重新求向量
+    assert [row[2] for row in SemanticCache(path, "new-model")._stale] == []
@@ -0,0 +1,103 @@
+import threading
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import qwen_client
+from qwen_client import QwenChat
+
+
+def _sse_body(*deltas):
+    """按 DashScope 流式接口的格式拼出 SSE 响应体，每个分片一帧"""
+    frames = []
+    for i, delta in enumerate(deltas):
+        frames.append(
+            f"id:{i + 1}\n"
+            "event:result\n"
+            f'data:{{"output":{{"choices":[{{"message":{{"role":"assistant","content":"{delta}"}}}}]}}}}\n\n'
+        )
+    return "".join(frames).encode()
+
+
+class _TrackingStream(httpx.SyncByteStream):
+    """记录响应体是否被关闭，用于检查流式连接没有泄漏"""
+
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def __iter__(self):
+        yield self.body
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def mock_client(monkeypatch):
+    """把共享连接池换成 MockTransport，handler 由各测试设置"""
+    state = {"handler": None}
+    client = httpx.Client(transport=httpx.MockTransport(lambda request: state["handler"](request)))
+    monkeypatch.setattr(qwen_client, "_get_http_client", lambda: client)
+    yield state
+    client.close()
+
+
+def _stream_text(qwen):
+    # 新版 langchain_core 会在流末尾追加一个空分片，这里只保留模型产出的文本
+    messages = [SystemMessage(content="system"), HumanMessage(content="user")]
+    return [chunk.content for chunk in qwen.stream(messages) if chunk.content]
+
+
+def test_stream_yields_sse_chunks_and_closes_response(mock_client):
+    streams = []
+
+    def handler(request):
+        assert request.headers["X-DashScope-SSE"] == "enable"
+        stream = _TrackingStream(_sse_body("你好", "世界"))
+        streams.append(stream)
+        return httpx.Response(200, stream=stream)
+
+    mock_client["handler"] = handler
+
+    chunks = _stream_text(QwenChat(api_key="test"))
+
+    assert chunks == ["你好", "世界"]
+    assert len(streams) == 1 and streams[0].closed
+
+
+def test_hedged_stream_uses_fast_request_and_closes_slow_one(mock_client, monkeypatch):
+    monkeypatch.setattr(qwen_client, "_HEDGE_DELAY", 0.05)
+    release_slow = threading.Event()
+    streams = []
+    calls = []
+    lock = threading.Lock()
+
+    def handler(request):
+        with lock:
+            index = len(calls)
+            calls.append(index)
+        if index == 0:
+            # 第一个请求迟迟不返回响应头，触发对冲请求
+            release_slow.wait(timeout=5)
+            stream = _TrackingStream(_sse_body("慢"))
+        else:
+            stream = _TrackingStream(_sse_body("快", "速"))
+        streams.append((index, stream))
+        return httpx.Response(200, stream=stream)
+
+    mock_client["handler"] = handler
+
+    chunks = _stream_text(QwenChat(api_key="test"))
+    release_slow.set()
+
+    assert chunks == ["快", "速"]
+    assert len(calls) == 2
+
+    # 落选的慢请求在完成后由回调关闭
+    for _ in range(100):
+        if len(streams) == 2 and all(stream.closed for _, stream in streams):
+            break
+        threading.Event().wait(0.01)
+    assert all(stream.closed for _, stream in streams)